@@ -1,13 +1,37 @@
 import os
-import io
+import time
+import threading
+import queue
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import firebirdsql
-import pandas as pd
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+import psycopg
 from apscheduler.schedulers.blocking import BlockingScheduler
 from tqdm import tqdm
 import logging
 
+# Cada COPY mira em ~64 MB codificados; o tamanho do bloco sai da largura média das linhas
+COPY_TARGET_BYTES = 64 * 1024 * 1024
+MIN_BLOCK_SIZE = 10000
+MAX_BLOCK_SIZE = 500000
+BLOCK_SIZE_PROBE_ROWS = 1000
+
+# Linhas rejeitadas por bloco com o mesmo SQLSTATE antes de tratar o erro como da tabela e não das linhas
+MAX_REJECTED_ROWS = 100
+
+# Índices só são removidos e recriados quando a carga acrescenta ao menos essa fração das linhas já existentes
+INDEX_REBUILD_MIN_FRACTION = 0.2
+
+# Códigos gds do Firebird para conexão perdida (isc_network_error, isc_net_read_err, isc_net_write_err,
+# isc_lost_db_connection, isc_att_shutdown); outros OperationalError são erros da consulta e não adianta repetir
+FIREBIRD_CONNECTION_GDS_CODES = {335544721, 335544726, 335544727, 335544741, 335544856}
+
+# Tabelas grandes com PK inteira são divididas em faixas de chave carregadas em paralelo
+PARALLEL_MIN_ROWS = 5000000
+PARALLEL_RANGES = 4
+
 class DatabaseMigration:
     def __init__(self):
         load_dotenv()
@@ -20,27 +44,66 @@ class DatabaseMigration:
             'charset': 'ISO8859_1'
         }
 
-        self.engine = create_engine(
-            f'postgresql+psycopg2://{os.getenv("POSTGRES_USER")}:{os.getenv("POSTGRES_PASSWORD")}@{os.getenv("POSTGRES_HOST")}:{os.getenv("POSTGRES_PORT")}/{os.getenv("POSTGRES_DB")}',
-            pool_size=5, max_overflow=10
-        )
+        self._pg = None
+        self._columns = {}
 
         self.ensure_bronze_schema()
 
         logging.basicConfig(filename='migration.log', level=logging.INFO,
                             format='%(asctime)s - %(levelname)s - %(message)s')
 
+    def connect_postgres(self):
+        return psycopg.connect(
+            host=os.getenv("POSTGRES_HOST"), port=os.getenv("POSTGRES_PORT"), dbname=os.getenv("POSTGRES_DB"),
+            user=os.getenv("POSTGRES_USER"), password=os.getenv("POSTGRES_PASSWORD"),
+            # A bronze é só landing da carga: sem esperar o flush do WAL a cada commit,
+            # e com memória folgada para ordenações e criação de índices
+            options='-c synchronous_commit=off -c work_mem=256MB -c maintenance_work_mem=1GB'
+        )
+
+    @property
+    def pg(self):
+        # Conexão de metadados criada sob demanda: cada processo do pool precisa da própria.
+        # Uma conexão fechada ou quebrada é trocada por outra na próxima chamada
+        if self._pg is None or self._pg.closed or self._pg.broken:
+            self._pg = self.connect_postgres()
+        return self._pg
+
+    @contextmanager
+    def _pg_transaction(self):
+        # Commit no fim; em erro, rollback para a conexão cacheada não ficar presa em transação abortada
+        pg = self.pg
+        try:
+            with pg.cursor() as cursor:
+                yield cursor
+            pg.commit()
+        except Exception:
+            try:
+                pg.rollback()
+            except Exception:
+                pass
+            if pg.closed or pg.broken:
+                self._pg = None
+            raise
+
+    def _exec(self, sql, params=None):
+        with self._pg_transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchone() if cursor.description else None
+
     def ensure_bronze_schema(self):
-        with self.engine.connect() as connection:
-            connection.execute(text("CREATE SCHEMA IF NOT EXISTS bronze;"))
-            connection.commit()
+        self._exec("CREATE SCHEMA IF NOT EXISTS bronze;")
+        # Progresso por tabela, atualizado junto com cada COPY para a retomada não depender de COUNT(*)
+        self._exec(
+            "CREATE TABLE IF NOT EXISTS bronze._migration_state ("
+            "table_name TEXT PRIMARY KEY, rows_loaded BIGINT NOT NULL, last_pk TEXT);"
+        )
+        self._exec("ALTER TABLE bronze._migration_state ADD COLUMN IF NOT EXISTS block_size INTEGER;")
+        self._exec("ALTER TABLE bronze._migration_state ADD COLUMN IF NOT EXISTS range_end TEXT;")
 
     def create_table_in_postgres(self, table_name, columns):
         column_definitions = ", ".join([f'"{col}" TEXT' for col in columns])
-        query = f'CREATE TABLE IF NOT EXISTS bronze."{table_name}" ({column_definitions});'
-        with self.engine.connect() as connection:
-            connection.execute(text(query))
-            connection.commit()
+        self._exec(f'CREATE TABLE IF NOT EXISTS bronze."{table_name}" ({column_definitions});')
 
     def list_firebird_tables(self):
         with firebirdsql.connect(**self.firebird_config) as conn:
@@ -48,81 +111,401 @@ class DatabaseMigration:
             cursor.execute("SELECT RDB$RELATION_NAME FROM RDB$RELATIONS WHERE RDB$SYSTEM_FLAG = 0;")
             return [row[0].strip() for row in cursor.fetchall()]
 
-    def sanitize_dataframe(self, df):
-        return df.apply(lambda col: col.map(lambda x: x.replace('\x00', '') if isinstance(x, str) else x))
+    def _load_all_schemas(self, tables):
+        # Uma única consulta ao catálogo traz as colunas de todas as tabelas, na ordem do SELECT *
+        tables = [t for t in tables if t not in self._columns]
+        if not tables:
+            return self._columns
+        placeholders = ", ".join("?" for _ in tables)
+        with firebirdsql.connect(**self.firebird_config) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT RDB$RELATION_NAME, RDB$FIELD_NAME, RDB$FIELD_POSITION FROM RDB$RELATION_FIELDS "
+                f"WHERE RDB$RELATION_NAME IN ({placeholders}) ORDER BY RDB$FIELD_POSITION",
+                tuple(tables)
+            )
+            for relation_name, field_name, _ in cursor.fetchall():
+                self._columns.setdefault(relation_name.strip(), []).append(field_name.strip())
+        return self._columns
+
+    def get_primary_key(self, cursor, table_name):
+        cursor.execute(
+            "SELECT s.RDB$FIELD_NAME FROM RDB$RELATION_CONSTRAINTS c "
+            "JOIN RDB$INDEX_SEGMENTS s ON s.RDB$INDEX_NAME = c.RDB$INDEX_NAME "
+            "WHERE c.RDB$RELATION_NAME = ? AND c.RDB$CONSTRAINT_TYPE = 'PRIMARY KEY' "
+            "ORDER BY s.RDB$FIELD_POSITION",
+            (table_name,)
+        )
+        key_columns = [row[0].strip() for row in cursor.fetchall()]
+        # Paginação por chave só com PK de uma coluna; PK composta cai no ROWS
+        return key_columns[0] if len(key_columns) == 1 else None
+
+    def block_query(self, table_name, offset, block_size, primary_key, last_key, range_end=None):
+        if primary_key is None:
+            return f"SELECT * FROM {table_name} ROWS {offset + 1} TO {offset + block_size}", ()
+        if last_key is None:
+            return f'SELECT FIRST {block_size} * FROM {table_name} ORDER BY "{primary_key}"', ()
+        if range_end is not None:
+            return (f'SELECT FIRST {block_size} * FROM {table_name} WHERE "{primary_key}" > ? AND "{primary_key}" <= ? '
+                    f'ORDER BY "{primary_key}"', (last_key, range_end))
+        return (f'SELECT FIRST {block_size} * FROM {table_name} WHERE "{primary_key}" > ? ORDER BY "{primary_key}"',
+                (last_key,))
+
+    def copy_values(self, row):
+        # Todas as colunas de destino são TEXT: cada campo vira str, e NULL do firebirdsql é sempre None.
+        # O Postgres rejeita NUL em TEXT mesmo no formato binário.
+        # str.replace é bem mais rápido que str.translate para remover um único caractere
+        return [value if value is None else value.replace('\x00', '') if isinstance(value, str) else str(value)
+                for value in row]
+
+    def estimate_block_size(self, rows, column_count):
+        # Mede a amostra como o COPY binário a envia: 2 bytes por linha, 4 de tamanho por campo e o utf-8 do valor
+        if not rows:
+            return MIN_BLOCK_SIZE
+        total_bytes = 0
+        for row in rows:
+            total_bytes += 2 + 4 * column_count
+            total_bytes += sum(len(value.encode()) for value in self.copy_values(row) if value is not None)
+        avg_row_bytes = max(1, total_bytes // len(rows))
+        return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, COPY_TARGET_BYTES // avg_row_bytes))
+
+    def save_migration_state(self, cursor, table_name, rows_loaded, last_key, block_size):
+        cursor.execute(
+            "INSERT INTO bronze._migration_state (table_name, rows_loaded, last_pk, block_size) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (table_name) DO UPDATE SET rows_loaded = EXCLUDED.rows_loaded, last_pk = EXCLUDED.last_pk, "
+            "block_size = EXCLUDED.block_size",
+            (table_name, rows_loaded, None if last_key is None else str(last_key), block_size)
+        )
+
+    def get_migration_state(self, table_name):
+        return self._exec(
+            "SELECT rows_loaded, last_pk, block_size FROM bronze._migration_state WHERE table_name = %s",
+            (table_name,)
+        )
+
+    def get_range_plan(self, table_name):
+        # Faixas de uma carga paralela ficam em linhas "<tabela>#<n>"; a faixa está concluída quando last_pk = range_end
+        with self._pg_transaction() as cursor:
+            cursor.execute(
+                "SELECT table_name, rows_loaded, last_pk, range_end FROM bronze._migration_state "
+                "WHERE table_name LIKE %s ORDER BY table_name",
+                (f"{table_name}#%",)
+            )
+            return [(name, rows_loaded, int(last_pk), int(range_end))
+                    for name, rows_loaded, last_pk, range_end in cursor.fetchall()]
+
+    def plan_key_ranges(self, cursor, table_name, primary_key, offset, last_key, remaining, block_size):
+        plan = self.get_range_plan(table_name)
+        if plan or primary_key is None or remaining < PARALLEL_MIN_ROWS:
+            return plan
+
+        if last_key is None:
+            cursor.execute(f'SELECT MIN("{primary_key}"), MAX("{primary_key}") FROM {table_name}')
+        else:
+            cursor.execute(f'SELECT MIN("{primary_key}"), MAX("{primary_key}") FROM {table_name} WHERE "{primary_key}" > ?',
+                           (last_key,))
+        min_key, max_key = cursor.fetchone()
+        if not isinstance(min_key, int) or not isinstance(max_key, int):
+            return plan
+
+        # Limite inferior exclusivo, superior inclusivo: (bounds[i], bounds[i + 1]]
+        start = min_key - 1
+        bounds = [start + (max_key - start) * i // PARALLEL_RANGES for i in range(PARALLEL_RANGES + 1)]
+        plan = [(f"{table_name}#{i}", 0, bounds[i], bounds[i + 1])
+                for i in range(PARALLEL_RANGES) if bounds[i] < bounds[i + 1]]
+
+        # O estado da tabela é gravado junto com o plano: a retomada nunca cai no COUNT(*),
+        # que contaria as faixas já carregadas
+        with self._pg_transaction() as pg_cursor:
+            self.save_migration_state(pg_cursor, table_name, offset, last_key, block_size)
+            for name, rows_loaded, range_start, range_end in plan:
+                pg_cursor.execute(
+                    "INSERT INTO bronze._migration_state (table_name, rows_loaded, last_pk, block_size, range_end) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    (name, rows_loaded, str(range_start), block_size, str(range_end))
+                )
+        return plan
+
+    def load_key_ranges(self, table_name, columns, block_size, primary_key, key_index, offset, plan):
+        pending = [(name, range_start, range_end) for name, _, range_start, range_end in plan if range_start < range_end]
+        print(f"Carregando a tabela {table_name} em {len(plan)} faixas de chave, {len(pending)} pendentes.")
+
+        # Cada faixa segura até dois blocos na fila e um em carga: o bloco é dividido entre as faixas
+        # para a tabela toda ocupar a mesma memória que uma carga sequencial
+        range_block_size = max(MIN_BLOCK_SIZE, block_size // PARALLEL_RANGES)
+
+        def load_range(name, range_start, range_end):
+            conn = firebirdsql.connect(**self.firebird_config)
+            self.load_blocks(conn, table_name, columns, range_block_size, primary_key, key_index, 0, range_start, None,
+                             name, f"{table_name}_stage_{name.rsplit('#', 1)[1]}", range_end=range_end,
+                             rebuild_indexes=False)
+
+        # Cada faixa tem as próprias conexões Firebird e Postgres e a própria transação;
+        # uma faixa que falha não desfaz as outras e é a única refeita na retomada
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+            futures = [executor.submit(load_range, *item) for item in pending]
+        for future in futures:
+            future.result()
+
+        plan = self.get_range_plan(table_name)
+        with self._pg_transaction() as cursor:
+            self.save_migration_state(cursor, table_name, offset + sum(rows for _, rows, _, _ in plan),
+                                      max(range_end for _, _, _, range_end in plan), block_size)
+            cursor.execute("DELETE FROM bronze._migration_state WHERE table_name LIKE %s", (f"{table_name}#%",))
+
+    def is_text_table(self, cursor, table_name):
+        # Tabelas bronze antigas podem ter colunas não TEXT; nelas o COPY vai em texto para o servidor converter os valores
+        cursor.execute(
+            "SELECT bool_and(data_type = 'text') FROM information_schema.columns "
+            "WHERE table_schema = 'bronze' AND table_name = %s",
+            (table_name,)
+        )
+        return bool(cursor.fetchone()[0])
+
+    def copy_rows(self, cursor, rows, table_name, column_count, binary=True):
+        # O psycopg monta o fluxo do COPY e envia em partes enquanto as linhas são escritas
+        copy_format = " WITH (FORMAT BINARY)" if binary else ""
+        with cursor.copy(f'COPY bronze."{table_name}" FROM STDIN{copy_format}') as copy:
+            if binary:
+                copy.set_types(['text'] * column_count)
+            for row in rows:
+                copy.write_row(self.copy_values(row))
+
+    def copy_block(self, cursor, rows, table_name, column_count, binary=True, rejected=None):
+        # Se o COPY falhar por dado inválido, divide o bloco ao meio e tenta cada metade: uma linha ruim custa O(log n) COPYs.
+        # Erros que não são de linha (tabela, conexão, formato do COPY) sobem direto. Devolve quantas linhas foram ignoradas
+        if rejected is None:
+            rejected = {}
+        cursor.execute("SAVEPOINT copy_block")
+        try:
+            self.copy_rows(cursor, rows, table_name, column_count, binary)
+            cursor.execute("RELEASE SAVEPOINT copy_block")
+            return 0
+        except psycopg.errors.DataError as e:
+            # Número de campos ou tipo binário diferente do da tabela afeta todas as linhas: não adianta dividir
+            if isinstance(e, (psycopg.errors.BadCopyFileFormat, psycopg.errors.InvalidBinaryRepresentation)):
+                raise
+            cursor.execute("ROLLBACK TO SAVEPOINT copy_block")
+            cursor.execute("RELEASE SAVEPOINT copy_block")
+            if len(rows) == 1:
+                # O mesmo erro linha após linha é da tabela: para a bisseção em vez de percorrer a árvore inteira.
+                # Blocos pequenos com poucas linhas ruins nunca chegam ao limite e só perdem essas linhas
+                rejected[e.sqlstate] = rejected.get(e.sqlstate, 0) + 1
+                if rejected[e.sqlstate] > MAX_REJECTED_ROWS:
+                    raise RuntimeError(f"Mais de {MAX_REJECTED_ROWS} linhas do bloco da tabela {table_name} "
+                                       f"rejeitadas com o mesmo erro: {e}") from e
+                print(f"Erro ao carregar linha da tabela {table_name}, linha ignorada: {e}")
+                return 1
+            middle = len(rows) // 2
+            return (self.copy_block(cursor, rows[:middle], table_name, column_count, binary, rejected)
+                    + self.copy_block(cursor, rows[middle:], table_name, column_count, binary, rejected))
+
+    def drop_indexes(self, cursor, table_name):
+        # Índices que sustentam constraints (PK, UNIQUE) ficam: DROP INDEX não os remove
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes i WHERE schemaname = 'bronze' AND tablename = %s "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint c "
+            "WHERE c.conindid = (quote_ident(i.schemaname) || '.' || quote_ident(i.indexname))::regclass)",
+            (table_name,)
+        )
+        indexes = cursor.fetchall()
+        for index_name, _ in indexes:
+            cursor.execute(f'DROP INDEX bronze."{index_name}"')
+        return [index_definition for _, index_definition in indexes]
 
-    def load_data_using_copy(self, df, table_name):
-        df = self.sanitize_dataframe(df)
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False, header=False)
-        csv_buffer.seek(0)
+    def get_destination_row_count(self, table_name):
+        return self._exec(f'SELECT COUNT(*) FROM bronze."{table_name}"')[0]
 
-        conn = self.engine.raw_connection()
-        cursor = conn.cursor()
+    def is_connection_error(self, error):
+        if isinstance(error, OSError):
+            return True
+        return bool(FIREBIRD_CONNECTION_GDS_CODES & set(getattr(error, 'gds_codes', None) or ()))
 
+    def close_firebird(self, conn):
+        if conn is None:
+            return
         try:
-            cursor.copy_expert(f'COPY bronze."{table_name}" FROM STDIN WITH CSV', csv_buffer)
-            conn.commit()
-        except Exception as e:
-            print(f"Erro ao carregar bloco para bronze.{table_name}: {e}")
-            conn.rollback()
-            self.load_rows_individually(df, table_name)
-        finally:
-            cursor.close()
             conn.close()
+        except Exception:
+            pass
 
-    def load_rows_individually(self, df, table_name):
-        conn = self.engine.raw_connection()
-        cursor = conn.cursor()
-        for index, row in df.iterrows():
-            try:
-                csv_buffer = io.StringIO()
-                row.to_frame().T.to_csv(csv_buffer, index=False, header=False)
-                csv_buffer.seek(0)
-                cursor.copy_expert(f'COPY bronze."{table_name}" FROM STDIN WITH CSV', csv_buffer)
-                conn.commit()
-            except Exception as e:
-                print(f"Erro ao carregar linha {index + 1} da tabela {table_name}: {e}")
-                conn.rollback()
-        cursor.close()
-        conn.close()
-
-    def get_destination_row_count(self, table_name):
-        with self.engine.connect() as connection:
-            result = connection.execute(text(f'SELECT COUNT(*) FROM bronze."{table_name}"'))
-            return result.scalar()
+    def extract_and_load_data_in_chunks(self, table_name, columns=None, block_size=None):
+        if columns is None:
+            columns = self._load_all_schemas([table_name])[table_name]
 
-    def extract_and_load_data_in_chunks(self, table_name, block_size=10000):
-        with firebirdsql.connect(**self.firebird_config) as conn:
+        # A mesma conexão Firebird serve a tabela inteira; quem a fecha é prefetch_blocks
+        conn = firebirdsql.connect(**self.firebird_config)
+        try:
             cursor = conn.cursor()
             cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
             total_records = cursor.fetchone()[0]
 
-            cursor.execute(f"SELECT * FROM {table_name} ROWS 1 TO 1")
-            columns = [desc[0].strip() for desc in cursor.description]
-
-        self.create_table_in_postgres(table_name, columns)
-        offset = self.get_destination_row_count(table_name)
+            self.create_table_in_postgres(table_name, columns)
+            state = self.get_migration_state(table_name)
+            if state is None:
+                # Tabela carregada antes do controle de progresso existir
+                offset, last_key, saved_block_size = self.get_destination_row_count(table_name), None, None
+            else:
+                offset, last_key, saved_block_size = state
+
+            if block_size is None:
+                block_size = saved_block_size
+            if block_size is None:
+                # Primeira carga da tabela: mede uma amostra; as próximas execuções reaproveitam o valor salvo
+                cursor.execute(f"SELECT FIRST {BLOCK_SIZE_PROBE_ROWS} * FROM {table_name}")
+                block_size = self.estimate_block_size(cursor.fetchall(), len(columns))
+
+            primary_key = self.get_primary_key(cursor, table_name)
+            key_index = columns.index(primary_key) if primary_key is not None else None
+            if primary_key is None:
+                last_key = None
+            elif last_key is None and offset > 0:
+                # Linhas já carregadas sem chave registrada vieram do ROWS sem ORDER BY, na ordem física da tabela,
+                # e não são as primeiras offset chaves da PK: continuar por chave duplicaria e pularia linhas
+                if offset < total_records:
+                    logging.warning(f"Tabela {table_name} carregada parcialmente sem chave registrada; "
+                                    f"continuando por ROWS a partir da linha {offset + 1}.")
+                primary_key, key_index = None, None
+
+            plan = self.plan_key_ranges(cursor, table_name, primary_key, offset, last_key,
+                                        total_records - offset, block_size)
+        except Exception:
+            conn.close()
+            raise
 
         print(f"Iniciando a migração da tabela {table_name}: {total_records} linhas na origem, {offset} já carregadas.")
 
-        with tqdm(total=total_records - offset, desc=f"Carregando {table_name}") as pbar:
-            while offset < total_records:
-                with firebirdsql.connect(**self.firebird_config) as conn:
-                    cursor = conn.cursor()
-                    query = f"SELECT * FROM {table_name} ROWS {offset + 1} TO {offset + block_size}"
-                    cursor.execute(query)
-                    rows = cursor.fetchall()
+        if plan:
+            conn.close()
+            self.load_key_ranges(table_name, columns, block_size, primary_key, key_index, offset, plan)
+            return
+
+        self.load_blocks(conn, table_name, columns, block_size, primary_key, key_index, offset, last_key,
+                         total_records, table_name, f"{table_name}_stage")
 
+    def load_blocks(self, conn, table_name, columns, block_size, primary_key, key_index, offset, last_key,
+                    total_records, state_name, stage_name, range_end=None, rebuild_indexes=True):
+        # O Postgres é aberto antes da thread de prefetch: se falhar, não sobra thread presa no put da fila
+        try:
+            pg_conn = self.connect_postgres()
+        except Exception:
+            conn.close()
+            raise
+        pg_cursor = pg_conn.cursor()
+
+        # Enquanto um bloco é carregado no Postgres, a thread já busca o próximo no Firebird
+        blocks = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        prefetcher = threading.Thread(target=self.prefetch_blocks,
+                                      args=(conn, table_name, offset, total_records, block_size,
+                                            primary_key, key_index, last_key, range_end, blocks, stop),
+                                      daemon=True)
+        prefetcher.start()
+
+        start_offset = offset
+        try:
+            # Uma única transação por tabela: os blocos vão para uma tabela UNLOGGED e só no fim
+            # entram na definitiva, sem um commit (e um fsync) por bloco
+            pg_cursor.execute(f'CREATE UNLOGGED TABLE bronze."{stage_name}" (LIKE bronze."{table_name}")')
+            binary = self.is_text_table(pg_cursor, table_name)
+
+            remaining = None if total_records is None else total_records - offset
+            with tqdm(total=remaining, desc=f"Carregando {state_name}") as pbar:
+                while True:
+                    rows = blocks.get()
+                    if rows is None:
+                        break
+                    if isinstance(rows, Exception):
+                        raise rows
+
+                    offset += len(rows)
+                    if key_index is not None:
+                        last_key = rows[-1][key_index]
+
+                    self.copy_block(pg_cursor, rows, stage_name, len(columns), binary)
+
+                    pbar.update(len(rows))
+
+            if offset > start_offset:
+                # Índices são recriados de uma vez no fim em vez de mantidos linha a linha no INSERT.
+                # Tudo na mesma transação: se algo falhar, o rollback devolve os índices originais.
+                # Faixas paralelas não mexem nos índices: o DROP INDEX travaria as outras transações.
+                # Cargas incrementais pequenas inserem com os índices no lugar: recriar custaria a tabela inteira
+                loaded_rows = offset - start_offset
+                if rebuild_indexes and (start_offset == 0 or loaded_rows >= INDEX_REBUILD_MIN_FRACTION * start_offset):
+                    index_definitions = self.drop_indexes(pg_cursor, table_name)
+                else:
+                    index_definitions = []
+                pg_cursor.execute(f'INSERT INTO bronze."{table_name}" SELECT * FROM bronze."{stage_name}"')
+                for index_definition in index_definitions:
+                    pg_cursor.execute(index_definition)
+            pg_cursor.execute(f'DROP TABLE bronze."{stage_name}"')
+            if range_end is not None:
+                last_key = range_end
+            self.save_migration_state(pg_cursor, state_name, offset, last_key, block_size)
+            pg_conn.commit()
+        except Exception:
+            pg_conn.rollback()
+            raise
+        finally:
+            stop.set()
+            while prefetcher.is_alive():
+                try:
+                    blocks.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            pg_cursor.close()
+            pg_conn.close()
+
+    def prefetch_blocks(self, conn, table_name, offset, total_records, block_size,
+                        primary_key, key_index, last_key, range_end, blocks, stop, max_retries=3):
+        retries = 0
+        try:
+            cursor = conn.cursor()
+            # Sem total (faixa de chave), lê até o Firebird não devolver mais linhas
+            while (total_records is None or offset < total_records) and not stop.is_set():
+                try:
+                    # A reconexão fica dentro da tentativa: se o servidor ainda estiver fora, conta como mais um retry
+                    if conn is None:
+                        conn = firebirdsql.connect(**self.firebird_config)
+                        cursor = conn.cursor()
+                    cursor.execute(*self.block_query(table_name, offset, block_size, primary_key, last_key, range_end))
+                    rows = cursor.fetchall()
+                except (firebirdsql.OperationalError, OSError) as e:
+                    # Conexão caiu no meio da tabela: reconecta e repete o mesmo bloco
+                    if not self.is_connection_error(e):
+                        raise
+                    retries += 1
+                    if retries > max_retries:
+                        raise
+                    logging.warning(f"Conexão com o Firebird perdida na tabela {table_name} ({e}), reconectando ({retries}/{max_retries}).")
+                    self.close_firebird(conn)
+                    conn = None
+                    time.sleep(2 ** retries)
+                    continue
+
+                retries = 0
                 if not rows:
                     break
-
-                df = pd.DataFrame(rows, columns=columns)
-                self.load_data_using_copy(df, table_name)
+                blocks.put(rows)
                 offset += len(rows)
-                pbar.update(len(rows))
+                if key_index is not None:
+                    last_key = rows[-1][key_index]
+            blocks.put(None)
+        except Exception as e:
+            blocks.put(e)
+        finally:
+            self.close_firebird(conn)
 
-    def run_migration(self):
+    def migrate_table(self, table, columns=None):
+        try:
+            print(f"Iniciando migração da tabela {table}")
+            self.extract_and_load_data_in_chunks(table, columns)
+            logging.info(f"Tabela {table} migrada com sucesso.")
+        except Exception as e:
+            logging.error(f"Erro ao migrar a tabela {table}: {e}")
+
+    def run_migration(self, max_workers=4):
         tables_to_load = [
             "FC11000", "FC11100", "FC31110", "FC31100", "FC03000", "FC04200", "FC04300", 
             "FC0D100", "FC01000", "FC03110",
@@ -132,16 +515,29 @@ class DatabaseMigration:
             "FC08000", "FC06000", "FC12410","FC0D000", "FC1B100","FC12500"
         ]
 
-        available_tables = self.list_firebird_tables()
+        # Sem repetições: duas cópias da mesma tabela no pool disputariam a mesma tabela de stage
+        tables_to_load = list(dict.fromkeys(tables_to_load))
+
+        available_tables = set(self.list_firebird_tables())
         valid_tables = [t for t in tables_to_load if t in available_tables]
+        schemas = self._load_all_schemas(valid_tables)
 
-        for table in valid_tables:
-            try:
-                print(f"Iniciando migração da tabela {table}")
-                self.extract_and_load_data_in_chunks(table)
-                logging.info(f"Tabela {table} migrada com sucesso.")
-            except Exception as e:
-                logging.error(f"Erro ao migrar a tabela {table}: {e}")
+        # spawn em vez de fork: conexões Firebird/Postgres herdadas do processo pai não são seguras
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker) as executor:
+            list(executor.map(migrate_table, valid_tables, [schemas.get(t) for t in valid_tables]))
+
+
+worker_migrator = None
+
+
+def init_worker():
+    global worker_migrator
+    worker_migrator = DatabaseMigration()
+
+
+def migrate_table(table, columns=None):
+    worker_migrator.migrate_table(table, columns)
 
 if __name__ == "__main__":
     print("Executando migração ")